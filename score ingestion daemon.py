@@ -0,0 +1,336 @@
+# =============================================================================
+#                            IMPORTS AND SETUP
+# =============================================================================
+# This script is the "ingestion daemon" for multi-kiosk deployments.
+# Each kiosk running the typing test drops its finished results into a local spool
+# directory as small files (see 'spool_score' in the main app). Each kiosk also runs
+# this daemon, which picks those files up in batches and merges them into one central
+# CSV store (usually on a network share).
+# Several daemons can share one store: each batch is written while holding a lock
+# file next to the store, so rows from different kiosks never interleave. (The share
+# must support file locking, as SMB and NFS shares normally do.)
+# The daemon also keeps a small status file in each spool directory, so the kiosk can
+# warn when results are piling up (daemon stopped, behind, or store unreachable).
+import argparse  # For reading the command-line options (--spool, --store, ...).
+import csv       # For writing the central scores file.
+import errno     # For recognising "lock is still busy" errors on Windows.
+import heapq     # For picking the oldest spool files without sorting the whole directory.
+import io        # For parsing rows read from the store as raw bytes.
+import json      # Spool files are small JSON documents.
+import os        # For listing, renaming and deleting files.
+import time      # For the polling interval and the back-off delays.
+
+# Locking is done differently on Windows and on Linux/macOS, so we import
+# whichever module this operating system provides.
+try:
+    import msvcrt  # Windows
+except ImportError:
+    msvcrt = None
+    import fcntl   # Linux / macOS
+
+# The columns of the central store. The first six match the single-machine
+# 'scores.csv' so the same spreadsheets keep working; the last three are added
+# so we know where a result came from and can recognise duplicates.
+STORE_HEADER = ["Username", "WPM", "Accuracy", "Difficulty", "TestType", "Duration", "Kiosk", "FinishedAt", "ResultID"]
+
+# The status file the daemon keeps in every spool directory (read by the kiosk app).
+# It starts with '.' so it is never mistaken for a result.
+STATUS_FILE = ".ingest-status.json"
+
+
+# =============================================================================
+#                            INGESTION DAEMON CLASS
+# =============================================================================
+class ScoreIngestionDaemon:
+    ONCE_MAX_FAILURES = 5  # In '--once' mode, give up after this many store failures in a row.
+
+    def __init__(self, spool_dirs, store_path, batch_size=2000, poll_interval=1.0, max_backoff=60.0):
+        self.spool_dirs = spool_dirs        # One or more directories that kiosks write into.
+        self.store_path = store_path        # The central CSV file (can live on a network share).
+        self.batch_size = batch_size        # The most spool files we read per cycle (keeps memory bounded).
+        self.poll_interval = poll_interval  # How long to sleep when the spool is empty.
+        self.max_backoff = max_backoff      # The longest we wait before retrying a failing store.
+        self.seen_ids = set()               # Every ResultID already in the store, used for deduplication.
+        self.store_offset = 0               # How many bytes of the store we have already read into 'seen_ids'.
+        self.skipped = set()                # Spool entries that could not be read or moved; ignored until restart.
+        self.pending = {}                   # How many results were waiting in each spool directory at the last scan.
+
+    # =============================================================================
+    #                            STORE FUNCTIONS
+    # =============================================================================
+    # Waits until no other daemon is writing to the store, then takes the lock.
+    # The lock is only held for one batch, so daemons on many kiosks take turns.
+    # The operating system releases it automatically if a daemon crashes or the
+    # power is cut, so nobody gets stuck behind a stale lock.
+    def lock_store(self):
+        lock_file = open(self.store_path + ".lock", "a+")
+        try:
+            if msvcrt:
+                lock_file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1) # Tries for about 10 seconds.
+                        break
+                    except OSError as e:
+                        if e.errno != errno.EDEADLOCK:
+                            raise
+            else:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX) # Waits until the other daemon is done.
+        except BaseException:
+            lock_file.close()
+            raise
+        return lock_file
+
+    # Releases the lock taken by 'lock_store'.
+    def unlock_store(self, lock_file):
+        try:
+            if msvcrt:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            lock_file.close() # Closing the file also releases the lock on Linux/macOS.
+
+    # Cuts off a half-written last row, left behind if the daemon was killed or the
+    # share dropped in the middle of a write. Without this, the next batch would be
+    # glued onto the end of that broken row.
+    def repair_store_tail(self):
+        try:
+            with open(self.store_path, "rb+") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size == 0:
+                    return
+                f.seek(size - 1)
+                if f.read(1) == b"\n":
+                    return  # The last row is complete.
+                # Walk backwards in chunks until we find the end of the last complete row.
+                end = size
+                keep = 0
+                while end > 0:
+                    start = max(end - 4096, 0)
+                    f.seek(start)
+                    newline = f.read(end - start).rfind(b"\n")
+                    if newline != -1:
+                        keep = start + newline + 1
+                        break
+                    end = start
+                f.truncate(keep)
+                f.flush()
+                os.fsync(f.fileno())
+                print(f"Removed a half-written row from the end of {self.store_path}.", flush=True)
+        except FileNotFoundError:
+            pass  # No store yet, so nothing to repair.
+
+    # Reads the rows added to the store since we last looked, and remembers their
+    # ResultIDs. Must be called while holding the store lock. This catches:
+    # - rows written by daemons on OTHER kiosks since our last batch;
+    # - at startup, the whole store, so a restarted daemon recognises results it
+    #   stored before crashing (but before deleting their spool files) as duplicates;
+    # - rows of one of OUR batches that reached the store before a write error.
+    def read_new_store_rows(self):
+        self.repair_store_tail()
+        try:
+            size = os.path.getsize(self.store_path)
+        except FileNotFoundError:
+            size = 0
+        if size < self.store_offset:
+            # The store was replaced or cut short by someone else; read it again from the start.
+            self.store_offset = 0
+            self.seen_ids = set()
+        if size == self.store_offset:
+            return
+
+        with open(self.store_path, "rb") as f:
+            f.seek(self.store_offset)
+            new_text = f.read(size - self.store_offset).decode("utf-8")
+        reader = csv.reader(io.StringIO(new_text, newline=""))
+        if self.store_offset == 0:
+            header = next(reader, None)
+            if header != STORE_HEADER:
+                raise SystemExit(f"{self.store_path} is not a central score store (unexpected header: {header}).")
+        id_column = STORE_HEADER.index("ResultID")
+        for row in reader:
+            if len(row) > id_column:
+                self.seen_ids.add(row[id_column])
+        self.store_offset = size
+
+    # =============================================================================
+    #                            INGESTION FUNCTIONS
+    # =============================================================================
+    # Finds up to 'batch_size' of the oldest finished spool files.
+    # Kiosks name their files "<timestamp>-<id>.json", so sorting by name is sorting by age.
+    # Files starting with '.' are still being written by a kiosk and are skipped.
+    def collect_batch(self):
+        candidates = []
+        for spool_dir in self.spool_dirs:
+            count = 0
+            try:
+                with os.scandir(spool_dir) as entries:
+                    for entry in entries:
+                        if entry.name.endswith(".json") and not entry.name.startswith(".") and entry.path not in self.skipped:
+                            candidates.append((entry.name, entry.path))
+                            count += 1
+                self.pending[spool_dir] = count
+            except FileNotFoundError:
+                continue  # A kiosk that has not finished any test yet has no spool directory.
+            except OSError as e:
+                print(f"Could not list spool directory {spool_dir}: {e}", flush=True)
+        return [path for name, path in heapq.nsmallest(self.batch_size, candidates)]
+
+    # Moves a spool file that cannot be parsed or read out of the way, so it is not retried forever.
+    # If even moving it fails (e.g. no permission), it is skipped until the daemon restarts.
+    def reject(self, path):
+        rejected_dir = os.path.join(os.path.dirname(path), "rejected")
+        try:
+            os.makedirs(rejected_dir, exist_ok=True)
+            os.replace(path, os.path.join(rejected_dir, os.path.basename(path)))
+            print(f"Rejected malformed spool file: {path}", flush=True)
+        except OSError as e:
+            self.skipped.add(path)
+            print(f"Skipping spool file {path}: could not move it to {rejected_dir}: {e}", flush=True)
+
+    # Reads one batch of spool files and appends the new results to the store.
+    # Returns how many spool files were handled (new, duplicate or rejected).
+    def ingest_once(self):
+        paths = self.collect_batch()
+        if not paths:
+            return 0
+
+        parsed = [] # (path, result_id, row) for every spool file we could read.
+        for path in paths:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    record = json.load(f)
+                result_id = record["result_id"]
+                if not isinstance(result_id, str) or not result_id:
+                    raise ValueError(f"invalid result_id: {result_id!r}")
+                row = [
+                    record["username"],
+                    f"{record['wpm']:.2f}",
+                    f"{record['accuracy']:.2f}",
+                    record["difficulty"],
+                    record["test_type"],
+                    record["duration"],
+                    record.get("kiosk", ""),
+                    record.get("finished_at", ""),
+                    result_id,
+                ]
+                # Keep every row on one line, so 'repair_store_tail' can find where rows end.
+                row = [str(value).replace("\r", " ").replace("\n", " ") for value in row]
+            except FileNotFoundError:
+                continue  # Another process already removed it.
+            except (ValueError, KeyError, TypeError):
+                self.reject(path)
+                continue
+            except OSError as e:
+                # Unreadable entry (e.g. written by another account, or a directory).
+                # Only problems with the STORE should stop ingestion, so quarantine it and go on.
+                print(f"Could not read spool file {path}: {e}", flush=True)
+                self.reject(path)
+                continue
+
+            parsed.append((path, result_id, row))
+
+        if parsed:
+            lock_file = self.lock_store()
+            try:
+                # Catch up with the store first, so results that are already in it
+                # (from any kiosk) are skipped.
+                self.read_new_store_rows()
+                rows, batch_ids = [], set()
+                for path, result_id, row in parsed:
+                    if result_id not in self.seen_ids and result_id not in batch_ids:
+                        batch_ids.add(result_id)
+                        rows.append(row)
+
+                # Write the whole batch with a single append and a single fsync. This is what
+                # keeps throughput high: one disk flush per batch, not one per result.
+                if rows:
+                    with open(self.store_path, "a", newline="", encoding="utf-8") as f:
+                        writer = csv.writer(f)
+                        if f.tell() == 0:
+                            writer.writerow(STORE_HEADER)
+                        writer.writerows(rows)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self.seen_ids.update(batch_ids)
+                    self.store_offset = os.path.getsize(self.store_path)
+            finally:
+                self.unlock_store(lock_file)
+
+        # Only delete the spool files once their rows are safely on disk.
+        for path, result_id, row in parsed:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # The row is stored; if this file comes back later it is recognised as a duplicate.
+                self.skipped.add(path)
+                print(f"Could not delete ingested spool file {path}: {e}", flush=True)
+        return len(paths)
+
+    # Writes the status file into every spool directory: when the daemon last ran,
+    # how many results are waiting, and whether the store could be written.
+    # The kiosk app reads it to warn when results are piling up.
+    def write_status(self, store_ok):
+        for spool_dir in self.spool_dirs:
+            status = {"updated": time.time(), "pending": self.pending.get(spool_dir, 0), "store_ok": store_ok}
+            status_path = os.path.join(spool_dir, STATUS_FILE)
+            try:
+                with open(status_path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(status, f)
+                os.replace(status_path + ".tmp", status_path)
+            except OSError:
+                pass # A missing or read-only spool directory; the kiosk will report the stale status.
+
+    # The main loop. It drains the spool as fast as it can while there is work,
+    # and sleeps when the spool is empty. If the store cannot be written (e.g. the
+    # network share is down) results simply stay in the spool, the status file tells
+    # the kiosk, and we wait longer and longer (up to 'max_backoff') before trying again.
+    def run(self, once=False):
+        backoff = self.poll_interval
+        failures = 0
+        while True:
+            # Problems with single spool files are handled inside 'ingest_once', so an
+            # OSError reaching this point always means the store could not be used.
+            # (Any rows of a failed batch that did reach the store are picked up by
+            # 'read_new_store_rows' before the next batch, so they are not written twice.)
+            try:
+                handled = self.ingest_once()
+                backoff = self.poll_interval
+                failures = 0
+                self.write_status(store_ok=True)
+            except OSError as e:
+                failures += 1
+                self.write_status(store_ok=False)
+                if once and failures >= self.ONCE_MAX_FAILURES:
+                    raise SystemExit(f"Could not write to {self.store_path}: {e}. Giving up after {failures} attempts.")
+                print(f"Could not write to {self.store_path}: {e}. Retrying in {backoff:.0f}s.", flush=True)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            if once and handled < self.batch_size:
+                return  # In '--once' mode, stop as soon as the spool is drained.
+            if handled < self.batch_size:
+                time.sleep(self.poll_interval)
+
+
+# =============================================================================
+#                            PROGRAM ENTRY POINT
+# =============================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge spooled typing test results into a central score store.")
+    parser.add_argument("--spool", action="append", required=True,
+                        help="Spool directory to ingest from. Repeat to serve several spools from one daemon.")
+    parser.add_argument("--store", required=True, help="Path of the central scores CSV file.")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Maximum spool files handled per batch.")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds to sleep when the spool is empty.")
+    parser.add_argument("--once", action="store_true", help="Drain the spool once and exit.")
+    args = parser.parse_args()
+
+    daemon = ScoreIngestionDaemon(args.spool, args.store, batch_size=args.batch_size, poll_interval=args.interval)
+    try:
+        daemon.run(once=args.once)
+    except KeyboardInterrupt:
+        pass
@@ -12,9 +12,295 @@ import time      # For tracking time during the test.
 import random    # For choosing random text passages.
 import os        # For interacting with the operating system (e.g., checking if the scores file exists).
 import csv       # UPDATED: Use csv module for robust CSV writing (handles quoting, commas properly).
+import json      # For writing results into the kiosk spool directory.
+import uuid      # For giving every result a unique ID (so the ingestion daemon can skip duplicates).
+import socket    # For recording which kiosk (computer) a result came from.
+import queue     # For handing journal entries to the background writer thread.
+import threading # For writing the crash-recovery journal without slowing down the UI.
+import collections # For keeping just the last few rows of 'scores.csv' when checking for duplicates.
 
 # Import specific components from the standard 'tkinter' library.
-from tkinter import messagebox, Text  # messagebox for showing pop-up errors; Text widget for multi-line text display.
+from tkinter import messagebox, Text, Canvas  # messagebox for pop-up errors; Text for multi-line text; Canvas for the WPM chart.
+
+# --- Kiosk Spool Setting ---
+# On a multi-kiosk install, set the TYPING_TEST_SPOOL environment variable to a folder.
+# Finished results are then dropped there as small files and merged into the central
+# store by 'score ingestion daemon.py'. When it is not set, scores go to 'scores.csv' as before.
+SPOOL_DIR = os.environ.get("TYPING_TEST_SPOOL", "")
+# The daemon keeps a status file in the spool. We warn after saving a score if it has not
+# updated it for this many seconds, or if this many results are waiting to be ingested.
+SPOOL_STATUS_TIMEOUT = 120
+SPOOL_BACKLOG_LIMIT = 5000
+
+# --- Crash-Recovery Journal ---
+# Tests in progress are checkpointed to this file so they survive a crash or power cut.
+JOURNAL_PATH = "session_journal.jsonl"
+# An interrupted test is only scored on recovery if it ran at least this long and has
+# at least this much typed text; a few seconds of typing is not a fair result.
+MIN_RECOVERY_SECONDS = 15
+MIN_RECOVERY_CHARS = 20
+
+
+# =============================================================================
+#                            HELPER FUNCTIONS
+# =============================================================================
+# Shrinks a long list of (x, y) points down to 'threshold' points while keeping the
+# shape of the line, using the "Largest-Triangle-Three-Buckets" (LTTB) algorithm.
+# The points are split into equal buckets, and from each bucket we keep the single
+# point that forms the biggest triangle with the point kept before it and the average
+# of the next bucket. Peaks and dips survive, flat stretches are thinned out.
+# This lets a long session draw a few hundred points instead of tens of thousands.
+def downsample_lttb(points, threshold):
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points) # Nothing to shrink.
+
+    xs = [p[0] for p in points] # Separate x and y lists make the sums below much faster.
+    ys = [p[1] for p in points]
+    sampled = [points[0]] # Always keep the first point.
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0 # Index of the point we kept most recently.
+    for i in range(threshold - 2):
+        # Average of the NEXT bucket (used as the third corner of the triangle).
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        next_count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / next_count
+        avg_y = sum(ys[next_start:next_end]) / next_count
+
+        # Pick the point in the CURRENT bucket that makes the largest triangle.
+        # (The triangle's area is half of this value, but only the comparison matters.)
+        ax, ay = xs[a], ys[a]
+        dx, dy = ax - avg_x, avg_y - ay
+        max_area = -1.0
+        for j in range(int(i * bucket_size) + 1, next_start):
+            area = abs(dx * (ys[j] - ay) - (ax - xs[j]) * dy)
+            if area > max_area:
+                max_area = area
+                a_next = j
+        sampled.append(points[a_next])
+        a = a_next
+
+    sampled.append(points[-1]) # Always keep the last point.
+    return sampled
+
+
+# =============================================================================
+#                            CHEAT DETECTION
+# =============================================================================
+# Watches the keystrokes of one session as they happen and decides whether they
+# could have come from a human. It only keeps a few running totals (not the full
+# keystroke history), so memory stays constant and each key costs a few additions.
+class KeystrokeMonitor:
+    MAX_INSERTION = 5        # More characters than this appearing in one key event means a paste.
+    MIN_INTERVALS = 20       # How many keystrokes we need before judging the timing.
+    MIN_MEAN_INTERVAL = 0.03 # Seconds. An average gap below this is over 400 WPM.
+    MIN_VARIATION = 0.1      # Humans are uneven; a std-dev under 10% of the mean gap looks scripted.
+
+    def __init__(self):
+        self.last_time = None      # When the previous key event happened.
+        self.last_length = 0       # How long the typed text was at the previous key event.
+        self.largest_insertion = 0 # The most characters that appeared in a single key event.
+        # Running mean and variance of the gaps between keys (Welford's method).
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    # Records a change in the typed text, e.g. one that arrived WITHOUT a key event
+    # (like a middle-click paste). It counts as an insertion but adds no timing gap.
+    def catch_up(self, typed_length):
+        inserted = typed_length - self.last_length
+        self.last_length = typed_length
+        if inserted > self.largest_insertion:
+            self.largest_insertion = inserted
+
+    # Records one key event: when it happened and how long the typed text is now.
+    def observe(self, timestamp, typed_length):
+        self.catch_up(typed_length)
+        if self.last_time is not None:
+            interval = timestamp - self.last_time
+            self.count += 1
+            delta = interval - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (interval - self.mean)
+        self.last_time = timestamp
+
+    # Returns a reason string if the session looks pasted or automated, otherwise None.
+    def verdict(self):
+        if self.largest_insertion > self.MAX_INSERTION:
+            return f"{self.largest_insertion} characters were inserted at once (pasted text)."
+        if self.count >= self.MIN_INTERVALS:
+            if self.mean < self.MIN_MEAN_INTERVAL:
+                return f"Keys arrived every {self.mean * 1000:.0f} ms on average, faster than a human can type."
+            std_dev = (self.m2 / (self.count - 1)) ** 0.5
+            if std_dev < self.MIN_VARIATION * self.mean:
+                return "Keystroke timing was too even to be human (automated typing)."
+        return None
+
+
+# =============================================================================
+#                            CRASH-RECOVERY JOURNAL
+# =============================================================================
+# A log of what is happening in each test: when it started, what has
+# been typed so far (checkpointed about once per second), the final score, and
+# whether that score was saved. If the app crashes, the next start reads this log
+# and finishes whatever was left open.
+# The app normally only puts entries on a queue (very cheap); a background thread
+# does the actual writing and flushing to disk, so keystrokes never wait on the disk.
+# The one entry that must be on disk before the app continues (the final score, just
+# before it is saved) is written with 'write_durable', which waits for the flush.
+# To stop the file growing forever on a kiosk that is never restarted, the journal is
+# regularly rewritten ("compacted") to hold only the latest entries of open tests.
+class SessionJournal:
+    COMPACT_EVERY = 300 # Compact after this many appended entries (about 5 minutes of checkpoints).
+
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.SimpleQueue() # (entry, done event) pairs waiting to be written.
+        self.file = None
+        self.thread = None
+        self.open_sessions = {}          # Latest entries of every open test (used only by the writer thread).
+        self.appended = 0                # Entries appended since the last compaction.
+        self.error = None                # A write error the app has not reported to the user yet.
+        self.healthy = True              # False while writes are failing (used to report each failure once).
+
+    # Reads the journal left behind by the previous run and returns every session
+    # that was never closed, as {"start": ..., "checkpoint": ..., "result": ...}.
+    def load_open_sessions(self):
+        sessions = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue # A line cut short by a power loss; everything before it is still good.
+                    session_id, kind = entry.get("session"), entry.get("type")
+                    if kind == "start":
+                        sessions[session_id] = {"start": entry, "checkpoint": None, "result": None}
+                    elif session_id in sessions:
+                        if kind == "closed":
+                            del sessions[session_id]
+                        else:
+                            sessions[session_id][kind] = entry
+        except FileNotFoundError:
+            pass # No journal means the last run never started a test.
+        return list(sessions.values())
+
+    # Starts a fresh, empty journal and the background writer thread.
+    # Only call this after the old journal has been recovered.
+    def open(self):
+        self.file = open(self.path, "w", encoding="utf-8")
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    # Queues one entry for writing. This is all the UI thread does on the keystroke path.
+    def write(self, entry):
+        self.queue.put((entry, None))
+
+    # Writes one entry and waits until it (and everything queued before it) is on disk.
+    # Returns True if it really reached the disk. Never call this on the keystroke path.
+    def write_durable(self, entry):
+        done = threading.Event()
+        done.ok = False
+        self.queue.put((entry, done))
+        done.wait()
+        return done.ok
+
+    # Runs on the background thread: writes queued entries and flushes them to disk.
+    # Everything that piled up while the disk was busy is written with a single flush.
+    # If the disk fails (e.g. it is full), the thread keeps running: the error is handed
+    # to the app to show, the file is closed, and every few seconds the journal is
+    # rewritten from the entries kept in memory until writing works again.
+    def write_loop(self):
+        running = True
+        while running:
+            try:
+                # Wait for the next entry (or, while the disk is failing, at most 5 seconds).
+                items = [self.queue.get(timeout=None if self.healthy else 5)]
+            except queue.Empty:
+                items = []
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in items: # 'None' is the signal from close() to stop.
+                running = False
+                items = items[:items.index(None)]
+            closed_any = self.track(entry for entry, done in items)
+            written = False
+            try:
+                # After a failure the file may be closed or damaged, so rebuild the whole journal from memory.
+                if not self.healthy or self.file is None or closed_any or self.appended + len(items) >= self.COMPACT_EVERY:
+                    self.compact()
+                elif items:
+                    self.file.write("".join(json.dumps(entry) + "\n" for entry, done in items))
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                    self.appended += len(items)
+                written = True
+                self.healthy = True
+            except OSError as e:
+                if self.healthy: # Only report the first error, not every retry.
+                    self.error = e
+                    self.healthy = False
+                self.close_file()
+            finally:
+                # Wake up anyone waiting in 'write_durable', telling them if it worked.
+                for entry, done in items:
+                    if done:
+                        done.ok = written
+                        done.set()
+        self.close_file()
+
+    # Closes the journal file, ignoring errors (the disk may be the thing that failed).
+    def close_file(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+
+    # Returns the last write error (once), so the app can tell the user about it.
+    def take_error(self):
+        error, self.error = self.error, None
+        return error
+
+    # Keeps 'open_sessions' up to date with new entries. Returns True if a test was closed.
+    def track(self, entries):
+        closed_any = False
+        for entry in entries:
+            session_id, kind = entry["session"], entry["type"]
+            if kind == "start":
+                self.open_sessions[session_id] = {"start": entry}
+            elif kind == "closed":
+                closed_any = self.open_sessions.pop(session_id, None) is not None or closed_any
+            elif session_id in self.open_sessions:
+                self.open_sessions[session_id][kind] = entry # Only the latest checkpoint is needed.
+        return closed_any
+
+    # Rewrites the journal so it holds only the latest entries of the open tests.
+    # The new journal is written to a temporary file and renamed over the old one,
+    # so a crash in the middle leaves either the old or the new journal, never half of one.
+    def compact(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for session in self.open_sessions.values():
+                f.write("".join(json.dumps(entry) + "\n" for entry in session.values()))
+            f.flush()
+            os.fsync(f.fileno())
+        self.close_file()
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.appended = 0
+
+    # Writes out anything still queued and stops the writer thread.
+    def close(self):
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
 
 
 # =============================================================================
@@ -32,6 +318,7 @@ class TypingTestApp:
         self.master.title("Modern Python Typing Test")
         self.master.geometry("1000x800")  # Set the initial size of the window.
         self.master.minsize(800, 550)     # Set the smallest size the window can be resized to.
+        self.master.protocol("WM_DELETE_WINDOW", self.on_close) # Run 'on_close' when the window's X button is clicked.
 
         # --- Sample Texts ---
         # A dictionary to hold all the typing passages, organized by difficulty.
@@ -73,6 +360,11 @@ class TypingTestApp:
         self.user_input = ""            # The current text typed by the user.
         self.correct_chars = 0          # A count of correctly typed characters.
         self.timer_after_id = None      # Stores the ID of the scheduled timer event, so we can cancel it.
+        self.wpm_points = []            # (seconds elapsed, WPM) recorded on every keystroke, for the chart.
+        self.error_points = []          # (seconds elapsed, error rate %) recorded on every keystroke, for the chart.
+        self.key_monitor = KeystrokeMonitor() # Watches keystroke timing to catch pasted or automated input.
+        self.session_id = ""            # A unique ID for the current test, used in the journal and as the result ID.
+        self.last_checkpoint = None     # The typed text at the last journal checkpoint (to skip unchanged ones).
 
         # --- Ghost/Pacemaker Variables ---
         self.ghost_wpm = ttk.IntVar(value=50) # A special tkinter variable to hold the target WPM for the ghost.
@@ -87,6 +379,12 @@ class TypingTestApp:
         self.test_frame = ttk.Frame(master, padding="40")
         self.results_frame = ttk.Frame(master, padding="40")
 
+        # --- Crash Recovery ---
+        # Finish any tests that were interrupted last time, then start a fresh journal.
+        self.journal = SessionJournal(JOURNAL_PATH)
+        self.recovered_count = self.recover_sessions()
+        self.journal.open()
+
         # Start the application by showing the initial welcome screen.
         self.show_main_screen()
 
@@ -106,6 +404,8 @@ class TypingTestApp:
         # Create and place widgets for the main screen.
         ttk.Label(self.main_frame, text="Welcome to the Typing Test!", font=("Helvetica", 24, "bold"), bootstyle="primary").pack(pady=30)
         ttk.Label(self.main_frame, text="Please enter your username:", font=("Helvetica", 14)).pack(pady=10)
+        if self.recovered_count:
+            ttk.Label(self.main_frame, text=f"Recovered {self.recovered_count} interrupted test(s) from the last run.", font=("Helvetica", 11), bootstyle="warning").pack()
 
         self.username_entry = ttk.Entry(self.main_frame, font=("Arial", 14), width=30)
         self.username_entry.pack(pady=10)
@@ -117,6 +417,15 @@ class TypingTestApp:
 
         ttk.Button(self.main_frame, text="Continue", command=self.show_options_screen, bootstyle="success").pack(pady=30)
 
+    # This function is called when the window is closed with its X button.
+    def on_close(self):
+        # Closing the window in the middle of a test means the user abandoned it on purpose.
+        # That is not a crash, so close the test in the journal instead of leaving it to be
+        # scored and saved by the recovery on the next start.
+        if self.is_running and self.test_started:
+            self.journal.write({"type": "closed", "session": self.session_id})
+        self.master.destroy()
+
     # This function is called when the Enter key is pressed on the main screen.
     def on_press_enter_main(self, event=None): # 'event=None' is needed because the key binding passes an event object.
         self.show_options_screen()
@@ -197,6 +506,10 @@ class TypingTestApp:
         self.accuracy_label = ttk.Label(self.metrics_frame, text="Accuracy: 0%", font=("Helvetica", 16, "bold"))
         self.accuracy_label.grid(row=0, column=2, padx=20)
 
+        # A small live chart of WPM and error rate. It is redrawn once per second by the timer.
+        self.live_chart = Canvas(self.test_frame, width=700, height=160, bg="#2b3e50", highlightthickness=0)
+        self.live_chart.pack(pady=10)
+
         # Define 'tags' for coloring the text in the text_display widget.
         # We can later apply these tags to specific characters.
         self.text_display.tag_configure("correct", foreground="#00bc8c")   # A green color for correct characters.
@@ -217,8 +530,30 @@ class TypingTestApp:
         ttk.Label(self.results_frame, text=f"Final WPM: {self.wpm:.2f}", font=("Helvetica", 16)).pack(pady=5)
         ttk.Label(self.results_frame, text=f"Final Accuracy: {self.accuracy:.2f}%", font=("Helvetica", 16)).pack(pady=5)
 
-        # Save the score to the file.
-        self.save_score()
+        # Draw the final WPM / error rate chart for the whole session.
+        final_chart = Canvas(self.results_frame, width=800, height=260, bg="#2b3e50", highlightthickness=0)
+        final_chart.pack(pady=10)
+        self.draw_chart(final_chart)
+
+        # Save the score to the file, unless the session looks pasted or automated.
+        rejection = self.key_monitor.verdict()
+        if rejection:
+            ttk.Label(self.results_frame, text=f"Score not saved: {rejection}", font=("Helvetica", 12), bootstyle="danger").pack(pady=5)
+            self.journal.write({"type": "closed", "session": self.session_id})
+        else:
+            record = self.score_record()
+            # Make sure the score is on disk in the journal BEFORE saving it, so a crash
+            # during saving cannot lose it. (This waits for one disk flush; it is not on
+            # the keystroke path.)
+            if not self.journal.write_durable({"type": "result", "session": self.session_id, "record": record}):
+                self.journal.take_error() # Covered by the warning below.
+                messagebox.showwarning("Journal Error", "The crash-recovery journal cannot be written, so this score "
+                                       "will be lost if the app crashes before it is saved.")
+            # Only close the test in the journal once the score is really saved. If saving
+            # failed (e.g. 'scores.csv' is open in Excel), the next start will try again.
+            if self.save_score(record):
+                self.journal.write({"type": "closed", "session": self.session_id})
+        self.report_journal_error()
 
         # Create buttons for re-attempting the test or exiting.
         re_attempt_frame = ttk.Frame(self.results_frame)
@@ -238,6 +573,19 @@ class TypingTestApp:
         elapsed_time = time.time() - self.start_time
         self.timer_seconds = int(elapsed_time)
         self.timer_label.config(text=f"Time: {self.timer_seconds}s")
+        self.draw_chart(self.live_chart) # Refresh the live chart once per second (not on every key).
+
+        # Read the entry directly, because text can arrive without any key event
+        # (e.g. a middle-click paste), and let the cheat detector see that change too.
+        self.user_input = self.input_entry.get()
+        self.key_monitor.catch_up(len(self.user_input))
+
+        # Checkpoint the typed text to the journal at most once per second (never per key).
+        if self.user_input != self.last_checkpoint:
+            self.last_checkpoint = self.user_input
+            self.journal.write({"type": "checkpoint", "session": self.session_id, "elapsed": elapsed_time,
+                                "input": self.user_input, "flagged": self.key_monitor.verdict() is not None})
+        self.report_journal_error()
 
         # Check if the time limit has been reached.
         if self.timer_seconds >= self.timer_duration.get():
@@ -280,11 +628,18 @@ class TypingTestApp:
         if not self.test_started:
             self.test_started = True
             self.start_time = time.time() # Record the precise start time.
+            # Open this test in the journal so it can be recovered after a crash.
+            self.session_id = uuid.uuid4().hex
+            self.journal.write({"type": "start", "session": self.session_id, "started_at": self.start_time,
+                                "username": self.username, "test_text": self.test_text,
+                                "difficulty": self.difficulty_level.get(), "test_type": self.test_type.get(),
+                                "duration": self.timer_duration.get()})
             self.update_timer()           # Start the main timer loop.
             self.update_ghost_cursor()    # Start the ghost cursor loop.
 
         self.user_input = self.input_entry.get()
         typed_length = len(self.user_input)
+        self.key_monitor.observe(time.perf_counter(), typed_length) # Feed the cheat detector (cheap, constant memory).
 
         # --- Live WPM Calculation ---
         # The standard formula for WPM is (characters typed / 5) / minutes elapsed.
@@ -314,6 +669,13 @@ class TypingTestApp:
         self.accuracy_label.config(text=f"Accuracy: {self.accuracy:.2f}%")
         self.text_display.config(state="disabled")
 
+        # Remember this moment for the chart. We skip the very first second, where
+        # dividing by a tiny elapsed time would give huge, meaningless WPM values.
+        elapsed_seconds = elapsed_minutes * 60
+        if elapsed_seconds >= 1:
+            self.wpm_points.append((elapsed_seconds, self.wpm))
+            self.error_points.append((elapsed_seconds, 100 - self.accuracy))
+
         # If the user has typed the entire text, end the test.
         if typed_length == len(self.test_text):
             self.end_test()
@@ -330,6 +692,7 @@ class TypingTestApp:
         # --- Final Score Calculation ---
         # Recalculate the scores one last time to ensure they are based on the final state.
         typed_length = len(self.input_entry.get())
+        self.key_monitor.catch_up(typed_length) # Catch text inserted without a key event (e.g. a middle-click paste).
         # UPDATED: Use the *actual* elapsed time since the test started (works for early finish too).
         elapsed_minutes = max((time.time() - self.start_time) / 60, 1e-9)
         self.wpm = (typed_length / 5) / elapsed_minutes if elapsed_minutes > 0 else 0
@@ -341,8 +704,94 @@ class TypingTestApp:
 
         self.show_results_screen()
 
-    # Saves the final score to a CSV file.
-    def save_score(self):
+    # Draws the WPM (green) and error rate (red) lines onto a canvas.
+    # Each series is downsampled to about one point per 2 pixels and drawn as ONE
+    # canvas line item, so even an hour-long session renders in a few milliseconds.
+    def draw_chart(self, canvas):
+        canvas.delete("all") # Clear the previous drawing.
+        width, height = int(canvas["width"]), int(canvas["height"])
+        left, right, top, bottom = 40, width - 40, 15, height - 20 # The plotting area inside the margins.
+
+        # Axes and legend.
+        canvas.create_line(left, bottom, right, bottom, fill="#8a9bad")
+        canvas.create_text(left - 5, top, text=" WPM", fill="#00bc8c", anchor="ne", font=("Helvetica", 9))
+        canvas.create_text(right + 5, top, text="Err %", fill="#e74c3c", anchor="nw", font=("Helvetica", 9))
+        if len(self.wpm_points) < 2:
+            return # Not enough data yet to draw a line.
+
+        max_time = self.wpm_points[-1][0]
+        max_wpm = max(max(w for t, w in self.wpm_points) * 1.1, 10)
+        canvas.create_text(left - 5, bottom, text="0", fill="#8a9bad", anchor="e", font=("Helvetica", 9))
+        canvas.create_text(left - 5, top + 12, text=f"{max_wpm:.0f}", fill="#8a9bad", anchor="e", font=("Helvetica", 9))
+        canvas.create_text(right, bottom + 3, text=f"{max_time:.0f}s", fill="#8a9bad", anchor="ne", font=("Helvetica", 9))
+
+        # Turn (seconds, value) points into flat [x1, y1, x2, y2, ...] canvas coordinates.
+        x_scale = (right - left) / max_time
+        max_points = (right - left) // 2
+        for points, top_value, color in [(self.wpm_points, max_wpm, "#00bc8c"), (self.error_points, 100, "#e74c3c")]:
+            y_scale = (bottom - top) / top_value
+            coords = []
+            for t, value in downsample_lttb(points, max_points):
+                coords.append(left + t * x_scale)
+                coords.append(bottom - min(value, top_value) * y_scale)
+            canvas.create_line(*coords, fill=color, width=2)
+
+    # Collects the current test's final score into a dictionary, ready to be saved.
+    def score_record(self):
+        return {
+            "result_id": self.session_id,
+            "username": self.username,
+            "wpm": self.wpm,
+            "accuracy": self.accuracy,
+            "difficulty": self.difficulty_level.get(),
+            "test_type": self.test_type.get(),
+            "duration": self.timer_duration.get(),
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    # Shows an error if the crash-recovery journal could not be written (e.g. the disk is full).
+    def report_journal_error(self):
+        error = self.journal.take_error()
+        if error:
+            messagebox.showerror("Journal Error", f"Could not write the crash-recovery journal: {error}")
+
+    # Turns a score record into the row written to 'scores.csv'.
+    def csv_row(self, record):
+        return [
+            record["username"],
+            f"{record['wpm']:.2f}",
+            f"{record['accuracy']:.2f}",
+            record["difficulty"],
+            record["test_type"],
+            str(record["duration"])
+        ]
+
+    # Checks whether a score's row is among the last rows of 'scores.csv'. Recovery uses
+    # this because the app may have crashed after saving a score but before the journal
+    # marked the test closed, and in 'scores.csv' mode nothing else removes duplicates.
+    def score_in_csv(self, record):
+        try:
+            with open("scores.csv", newline="", encoding="utf-8") as f:
+                recent_rows = collections.deque(csv.reader(f), maxlen=20)
+        except FileNotFoundError:
+            return False
+        return self.csv_row(record) in recent_rows
+
+    # Saves a score record to a CSV file (or to the kiosk spool, if one is configured).
+    # Returns True if the score was saved.
+    def save_score(self, record):
+        if SPOOL_DIR:
+            try:
+                self.spool_score(record)
+            except OSError as e:
+                messagebox.showerror("Save Error", f"Could not save score to spool: {e}")
+                return False
+            # The score is safe in the spool, but tell staff if results are piling up.
+            warning = self.spool_backlog_warning()
+            if warning:
+                messagebox.showwarning("Results Server", f"Your score was saved on this kiosk, but {warning}")
+            return True
+
         try:
             # UPDATED: Use csv.writer with UTF-8 to handle commas/encoding safely. Keep header logic.
             file_exists = os.path.exists("scores.csv")
@@ -350,17 +799,95 @@ class TypingTestApp:
                 writer = csv.writer(f)
                 if not file_exists or os.stat("scores.csv").st_size == 0:
                     writer.writerow(["Username", "WPM", "Accuracy", "Difficulty", "TestType", "Duration"])
-                writer.writerow([
-                    self.username,
-                    f"{self.wpm:.2f}",
-                    f"{self.accuracy:.2f}",
-                    self.difficulty_level.get(),
-                    self.test_type.get(),
-                    self.timer_duration.get()
-                ])
+                writer.writerow(self.csv_row(record))
         except IOError as e:
             # If the file cannot be opened (e.g., it's open in Excel), show an error message.
             messagebox.showerror("Save Error", f"Could not save score to file: {e}")
+            return False
+        return True
+
+    # Reads the status file the ingestion daemon keeps in the spool directory and returns
+    # a warning if results are piling up instead of reaching the central store.
+    def spool_backlog_warning(self):
+        try:
+            with open(os.path.join(SPOOL_DIR, ".ingest-status.json"), encoding="utf-8") as f:
+                status = json.load(f)
+            updated, pending, store_ok = status["updated"], status["pending"], status["store_ok"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return "the results ingestion daemon has not reported on this kiosk yet."
+        if time.time() - updated > SPOOL_STATUS_TIMEOUT:
+            return f"the results ingestion daemon has not run for {time.time() - updated:.0f} seconds."
+        if not store_ok:
+            return "the results ingestion daemon cannot reach the central score store."
+        if pending >= SPOOL_BACKLOG_LIMIT:
+            return f"{pending} results are waiting to be sent to the central score store."
+        return None
+
+    # Drops a score record into the spool directory as one small JSON file.
+    # The file is written under a hidden temporary name first and then renamed,
+    # so the ingestion daemon never sees a half-written result.
+    def spool_score(self, record):
+        record = dict(record, kiosk=socket.gethostname())
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        # Starting the name with a timestamp lets the daemon ingest results oldest-first.
+        file_name = f"{time.time_ns()}-{record['result_id']}.json"
+        temp_path = os.path.join(SPOOL_DIR, f".{file_name}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno()) # Make sure the result is on disk even if the power goes out right after.
+        os.replace(temp_path, os.path.join(SPOOL_DIR, file_name)) # Renaming is atomic, so the file appears all at once.
+
+    # Finishes the tests that the previous run left open in the journal:
+    # - a test whose score was shown but maybe not saved gets its score saved now;
+    # - a test cut off half-way is scored from its last checkpoint, just like end_test would,
+    #   and its Duration is the time it ACTUALLY ran (not the chosen duration), so it can be
+    #   told apart from a full test.
+    # Tests that are too short (see MIN_RECOVERY_SECONDS/CHARS), or flagged by the cheat
+    # detector, are dropped.
+    # Returns how many tests were recovered.
+    def recover_sessions(self):
+        recovered = 0
+        failed = []
+        for session in self.journal.load_open_sessions():
+            if session["result"]:
+                record = session["result"]["record"]
+                # Skip it if the crashed run had already written it to 'scores.csv'.
+                # (In spool mode the ingestion daemon removes duplicates by result ID.)
+                if not SPOOL_DIR and self.score_in_csv(record):
+                    continue
+            elif (session["checkpoint"] and not session["checkpoint"]["flagged"]
+                  and session["checkpoint"]["elapsed"] >= MIN_RECOVERY_SECONDS
+                  and len(session["checkpoint"]["input"]) >= MIN_RECOVERY_CHARS):
+                start, checkpoint = session["start"], session["checkpoint"]
+                typed = checkpoint["input"]
+                elapsed_minutes = max(checkpoint["elapsed"] / 60, 1e-9)
+                correct = sum(1 for typed_char, text_char in zip(typed, start["test_text"]) if typed_char == text_char)
+                record = {
+                    "result_id": start["session"],
+                    "username": start["username"],
+                    "wpm": (len(typed) / 5) / elapsed_minutes,
+                    "accuracy": (correct / len(typed)) * 100,
+                    "difficulty": start["difficulty"],
+                    "test_type": start["test_type"],
+                    "duration": round(checkpoint["elapsed"]), # How long it really ran before the crash.
+                    "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(start["started_at"] + checkpoint["elapsed"])),
+                    "recovered": True,
+                }
+            else:
+                continue
+
+            if self.save_score(record):
+                recovered += 1
+            else:
+                failed.append(record)
+
+        # Scores we still could not save are carried over into the new journal,
+        # so the next start tries again.
+        for record in failed:
+            self.journal.write({"type": "start", "session": record["result_id"]})
+            self.journal.write({"type": "result", "session": record["result_id"], "record": record})
+        return recovered
 
     # This function is called when the "Take Same Test" button is clicked.
     def restart_same_test(self):
@@ -383,11 +910,16 @@ class TypingTestApp:
         self.user_input = ""
         self.correct_chars = 0
         self.ghost_position = 0
+        self.wpm_points = []
+        self.error_points = []
+        self.key_monitor = KeystrokeMonitor()
+        self.last_checkpoint = None
 
         # Reset the display labels.
         self.timer_label.config(text="Time: 0s")
         self.wpm_label.config(text="WPM: 0")
         self.accuracy_label.config(text="Accuracy: 0%")
+        self.live_chart.delete("all") # Clear the chart from the last attempt.
 
         # --- Reset the Text Display and Input Box ---
         # This section is crucial for fixing the "retake test" bug.
@@ -417,3 +949,5 @@ if __name__ == "__main__":
     # Start the tkinter event loop. The program will now wait for user actions
     # (like clicks and keypresses) and will stay open until the window is closed.
     root.mainloop()
+    # Write out any journal entries still waiting, so finished tests are marked as closed.
+    app.journal.close()